@@ -0,0 +1,268 @@
+"""Shared page setup for the Career Graph Explorer: styles, session state and the graph builder."""
+import collections
+import functools
+import math
+import urllib.parse
+
+import orjson
+import streamlit as st
+
+HISTORY_LIMIT = 200
+GRAPH_CACHE_LIMIT = 20  # Recently viewed graphs kept in the session for instant restore
+
+# Radial layout (pixels): Layer 1 on an inner ring, Layer 2 fanned out around its parent
+LAYER1_RADIUS = 220
+LAYER2_RADIUS = 420
+LAYER2_SPREAD = 0.35  # Radians between siblings on the outer ring
+
+# Node sizes: a per-layer base, grown by DEGREE_SIZE_STEP for each extra link, capped per layer.
+# Makes hubs stand out, e.g. a technology shared by several Layer 1 companies.
+LAYER_SIZES = (45, 30, 20)
+LAYER_SIZE_CAPS = (45, 40, 28)
+DEGREE_SIZE_STEP = 2
+
+# Node styling per mode, as (Layer 0, Layer 1, Layer 2)
+LAYER_STYLES = {
+    "Company Discovery": {
+        'colors': ("#FF4B4B", "#00C0F2", "#1DB954"), # Green for secondary companies
+        'shapes': ("dot", "dot", "dot"),
+        'l2_dashes': False,
+    },
+    "Role Search": {
+        'colors': ("#B19CD9", "#FF4B4B", "#00C0F2"), # Blue for Certifications
+        'shapes': ("square", "diamond", "star"),
+        'l2_dashes': True, # Role -> certification edges are dashed
+    },
+}
+
+# Emitted on every run: Streamlit drops elements that a rerun does not re-emit,
+# so skipping this after the first run would strip the styles from the page.
+CSS_BLOCK = """
+<style>
+    /* ADAPTIVE CARD STYLING */
+    .deep-dive-card {
+        background-color: var(--secondary-background-color);
+        color: var(--text-color);
+        padding: 15px;
+        border-radius: 10px;
+        border: 1px solid rgba(128, 128, 128, 0.2);
+        height: 100%;
+    }
+    .deep-dive-card p {
+        margin-bottom: 10px;
+        line-height: 1.4;
+        font-size: 0.95em;
+    }
+    .highlight-title {
+        color: #FF4B4B;
+        font-weight: bold;
+        font-size: 1.0em;
+        text-transform: uppercase;
+        letter-spacing: 0.5px;
+    }
+    .warning-box {
+        background-color: #2d2222;
+        border-left: 5px solid #ff4b4b;
+        padding: 15px;
+        border-radius: 5px;
+        color: #ffcfcf;
+        font-size: 0.9em;
+        margin-bottom: 20px;
+        display: flex;
+        align-items: center;
+    }
+    /* ATTEMPT TO FORCE GRAPH BACKGROUND (for dark theme visibility) */
+    iframe {
+        background-color: #0e1117 !important;
+    }
+    /* Button Tweaks */
+    .stButton button {
+        width: 100%;
+    }
+    /* Cost Tracker (Adjusted from original) */
+    .cost-tracker {
+        font-size: 0.8em;
+        color: #00FF00;
+        margin-top: 10px;
+        text-align: right;
+    }
+    /* Network Tab List */
+    .net-item {
+        padding: 8px 0;
+        border-bottom: 1px solid rgba(128, 128, 128, 0.2);
+    }
+    .net-name {
+        font-weight: bold;
+    }
+    .net-reason, .net-subs {
+        font-size: 0.875em;
+        opacity: 0.7;
+    }
+</style>
+"""
+
+
+def init_state():
+    """Seeds st.session_state with the defaults the page expects (keys that already exist are kept)."""
+    if 'mode' not in st.session_state:
+        st.session_state.mode = "Company Discovery" 
+    if 'company_search_term' not in st.session_state:
+        st.session_state.company_search_term = "OpenAI"
+    if 'role_search_term' not in st.session_state:
+        st.session_state.role_search_term = "Project Manager"
+    if 'graph_data' not in st.session_state:
+        st.session_state.graph_data = None
+    if 'graph_json' not in st.session_state:
+        st.session_state.graph_json = None # Stable serialized graph_data; the graph-builder cache key
+    if 'node_index' not in st.session_state:
+        st.session_state.node_index = {} # Node name -> dossier fields for graph_data
+    if 'current_key' not in st.session_state:
+        st.session_state.current_key = None # (mode, center name) of graph_data; the refetch gate
+    if 'rendered_graph' not in st.session_state:
+        st.session_state.rendered_graph = None # (graph_json, nodes, edges) from the last render
+    if 'history' not in st.session_state:
+        st.session_state.history = collections.deque(maxlen=HISTORY_LIMIT)
+    if 'history_set' not in st.session_state:
+        st.session_state.history_set = set() # O(1) membership sidecar for history
+    if 'graph_cache' not in st.session_state:
+        st.session_state.graph_cache = collections.OrderedDict() # (mode, name, filters) -> graph_data, LRU order
+    if 'prefetch' not in st.session_state:
+        st.session_state.prefetch = [] # Background batch Futures whose cost hasn't been counted yet
+    if 'prefetched_for' not in st.session_state:
+        st.session_state.prefetched_for = None # (graph_json, filters) whose neighbors were already submitted
+    if 'token_usage' not in st.session_state:
+        st.session_state.token_usage = 0
+    if 'session_cost' not in st.session_state:
+        st.session_state.session_cost = 0.0
+    if 'last_clicked' not in st.session_state:
+        st.session_state.last_clicked = None
+    if 'last_click_ts' not in st.session_state:
+        st.session_state.last_click_ts = 0.0
+    if 'launch_ts' not in st.session_state:
+        st.session_state.launch_ts = 0.0
+    if 'launch_inflight' not in st.session_state:
+        st.session_state.launch_inflight = False # Set by Launch, cleared once its fetch returns
+    if 'fetch_error' not in st.session_state:
+        st.session_state.fetch_error = None # Last error message shown by gemini_backend
+    if 'failed_fetch' not in st.session_state:
+        st.session_state.failed_fetch = None # (mode, query, filters) and error of a launch that failed last run
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_graph_columns(graph_json, mode):
+    """Flattens a serialized graph into parallel per-node / per-edge lists (structure of arrays).
+
+    Cached on the serialized graph, so reruns (and other sessions viewing the same graph) skip the build.
+    Bounded, since every explored node adds a graph.
+    """
+    data = orjson.loads(graph_json)
+    role_search = mode == "Role Search"
+    style = LAYER_STYLES[mode]
+    center_name = data['center_node']['name']
+    connections = data['connections']
+    # Layer 2 as flat (parent, name, reason) rows
+    l2_rows = [
+        (item['name'], sub['name'], sub['reason'])
+        for item in connections for sub in item.get('sub_connections', ())
+    ]
+
+    # Nodes are deduplicated by name; a name keeps its highest layer (0 > 1 > 2)
+    seen = {center_name}
+    l1_nodes = [item for item in connections if not (item['name'] in seen or seen.add(item['name']))]
+    l2_nodes = [row for row in l2_rows if not (row[1] in seen or seen.add(row[1]))]
+    n1, n2 = len(l1_nodes), len(l2_nodes)
+
+    # Degree of every node over the (undeduplicated) edge list
+    degree = collections.Counter(item['name'] for item in connections)
+    degree.update(parent for parent, _, _ in l2_rows)
+    degree.update(name for _, name, _ in l2_rows)
+
+    # Layer 0: Center | Layer 1: Companies or Alternative Roles | Layer 2: Secondary Companies or Certifications
+    node_columns = {
+        'ids': [center_name] + [item['name'] for item in l1_nodes] + [row[1] for row in l2_nodes],
+        'sizes': (
+            [LAYER_SIZES[0]]
+            + [min(LAYER_SIZES[1] + DEGREE_SIZE_STEP * (degree[item['name']] - 1), LAYER_SIZE_CAPS[1]) for item in l1_nodes]
+            + [min(LAYER_SIZES[2] + DEGREE_SIZE_STEP * (degree[row[1]] - 1), LAYER_SIZE_CAPS[2]) for row in l2_nodes]
+        ),
+        'colors': [style['colors'][0]] + [style['colors'][1]] * n1 + [style['colors'][2]] * n2,
+        'shapes': [style['shapes'][0]] + [style['shapes'][1]] * n1 + [style['shapes'][2]] * n2,
+        'titles': (
+            [None]
+            + [item['reason'] for item in l1_nodes]
+            + [
+                f"Cert for {parent}: {reason}" if role_search else f"Connected to {parent}"
+                for parent, _, reason in l2_nodes
+            ]
+        ),
+    }
+
+    # Deterministic positions, so the browser needs no physics simulation and nodes don't move on rerun
+    step = 2 * math.pi / max(n1, 1)
+    angles = {item['name']: i * step for i, item in enumerate(l1_nodes)}
+    sibling_counts = collections.Counter(row[0] for row in l2_nodes)
+    sibling_index = collections.Counter()
+    l2_angles = [None] * n2
+    for i, (parent, _, _) in enumerate(l2_nodes):
+        offset = sibling_index[parent] - (sibling_counts[parent] - 1) / 2
+        sibling_index[parent] += 1
+        l2_angles[i] = angles.get(parent, 0.0) + offset * LAYER2_SPREAD
+    l1_angles = [angles[item['name']] for item in l1_nodes]
+    node_columns['xs'] = (
+        [0]
+        + [round(LAYER1_RADIUS * math.cos(a)) for a in l1_angles]
+        + [round(LAYER2_RADIUS * math.cos(a)) for a in l2_angles]
+    )
+    node_columns['ys'] = (
+        [0]
+        + [round(LAYER1_RADIUS * math.sin(a)) for a in l1_angles]
+        + [round(LAYER2_RADIUS * math.sin(a)) for a in l2_angles]
+    )
+
+    e1, e2 = len(connections), len(l2_rows)
+    edge_columns = {
+        'sources': [center_name] * e1 + [row[0] for row in l2_rows],
+        'targets': [item['name'] for item in connections] + [row[1] for row in l2_rows],
+        'colors': ["#808080"] * e1 + ["#404040"] * e2,
+        'widths': [2] * e1 + [1] * e2,
+        'dashes': [False] * e1 + [style['l2_dashes']] * e2,
+    }
+    return {'nodes': node_columns, 'edges': edge_columns}
+
+
+# vis-network interaction options (forwarded by Config): skip edge redraws while dragging, delay hover tooltips
+GRAPH_INTERACTION = {"hideEdgesOnDrag": True, "tooltipDelay": 200}
+
+@st.cache_resource(show_spinner=False)
+def graph_config(mode):
+    """Builds the agraph Config for a mode once per process (it's read-only, so sessions share it)."""
+    # Imported here so the landing page / sidebar never pay for loading the component
+    from streamlit_agraph import Config
+
+    return Config(
+        width=1400,
+        height=550,
+        directed=mode != "Company Discovery", # Role search can be seen as directed
+        physics=False, # Positions are precomputed by build_graph_columns
+        hierarchical=False,
+        nodeHighlightBehavior=True,
+        highlightColor="#F7A7A6",
+        collapsible=False,
+        backgroundColor="#0e1117",
+        interaction=GRAPH_INTERACTION
+    )
+
+@functools.lru_cache(maxsize=256)
+def action_links(node_name, mode):
+    """Returns the Actions-tab (label, url) pairs for a node. Pure, so memoized per process."""
+    query = urllib.parse.quote_plus(node_name) # Spaces as '+', as the search sites expect in query strings
+    if mode == "Company Discovery":
+        return (
+            (f"💼 Jobs at {node_name} (LinkedIn)", f"https://www.linkedin.com/jobs/search/?keywords={query}"),
+            (f"📰 News about {node_name} (Google)", f"https://www.google.com/search?q={query}+news&tbm=nws"),
+        )
+    # Role Search actions
+    return (
+        (f"💼 Search Jobs for {node_name}", f"https://www.linkedin.com/jobs/search/?keywords={query}"),
+        ("🔎 Research Requirements (Google)", f"https://www.google.com/search?q={query}+certification+requirements"),
+    )
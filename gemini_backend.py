@@ -0,0 +1,544 @@
+"""Gemini client setup, response caching and prompt dispatch."""
+import os
+import re
+import time
+import hashlib
+import functools
+import threading
+import concurrent.futures
+
+import orjson
+import streamlit as st
+
+from prompts import (
+    PROMPT_VERSION, SYSTEM_INSTRUCTIONS, CONSTRAINTS_TEMPLATES, RESPONSE_SCHEMA, BATCH_RESPONSE_SCHEMA
+)
+
+MODEL_NAME = "gemini-2.5-flash"
+CACHE_DIR = os.environ.get("CAREER_CACHE_DIR", "/tmp/career_cache")  # Point at a volume to survive redeploys
+CACHE_EXPIRE_SECONDS = 7 * 86400  # One week
+STREAM_PREVIEW_EVERY = 3  # Chunks between live progress updates while streaming
+PREFETCH_LIMIT = 4  # Neighbors warmed per graph and filter set (batched into one paid API call)
+BACKGROUND_WORKERS = 4  # Upper bound on concurrent background Gemini calls per process (rate limits)
+REPAIR_ATTEMPTS = 2  # Re-asks after a malformed response before giving up
+# Approximate Gemini Flash pricing, per token (input $0.0001 / 1K tokens, output $0.0002 / 1K tokens)
+INPUT_COST_PER_TOKEN = 0.0001 / 1000
+OUTPUT_COST_PER_TOKEN = 0.0002 / 1000
+CACHED_INPUT_RATE = 0.25  # Implicitly cached prompt tokens bill at a fraction of the input rate
+
+# Validators for the compact response, compiled on first use rather than at import.
+# A plain lru_cache (not st.cache_resource) because prefetch threads call it too.
+@functools.lru_cache(maxsize=1)
+def _validators():
+    import fastjsonschema
+
+    return fastjsonschema.compile(RESPONSE_SCHEMA), fastjsonschema.compile(BATCH_RESPONSE_SCHEMA)
+
+def _validate_response(data):
+    """Raises a ValueError (JsonSchemaException) if a graph doesn't match RESPONSE_SCHEMA."""
+    _validators()[0](data)
+
+def _validate_batch(graphs):
+    """Raises a ValueError (JsonSchemaException) if a batch doesn't match BATCH_RESPONSE_SCHEMA."""
+    _validators()[1](graphs)
+
+# In-flight requests shared by every session in this process (single-flight)
+_inflight = {}
+_inflight_lock = threading.Lock()
+# Keys a background batch is fetching. Kept apart from _inflight so a click never waits on a
+# batch (no streamed preview, and it only returns once every graph in it is done).
+_batch_inflight = set()
+
+@st.cache_resource
+def _configure_sdk(api_key):
+    """Imports the SDK and sets its global credentials once per process (and per key)."""
+    # Imported lazily: the SDK pulls in protobuf/grpc, which is slow on a cold start
+    import google.generativeai as genai
+
+    # Explicit gRPC: the SDK keeps one client (and its channel) per process after this, so every
+    # model built below reuses the same warm connection instead of handshaking per request
+    genai.configure(api_key=api_key, transport="grpc")
+    return genai
+
+@st.cache_resource
+def _get_model(api_key, system_instruction=None, response_schema=None):
+    """Builds the GenerativeModel once per process for each instruction/schema combination."""
+    genai = _configure_sdk(api_key)
+    generation_config = None
+    if response_schema is not None:
+        generation_config = genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=response_schema,
+        )
+    return genai.GenerativeModel(
+        MODEL_NAME,
+        system_instruction=system_instruction,
+        generation_config=generation_config,
+    )
+
+@st.cache_resource(show_spinner=False)
+def _load_api_key():
+    """Reads the API key from Streamlit secrets, falling back to the environment, once per process.
+
+    Raises KeyError when it isn't set; exceptions aren't cached, so adding the key later still works.
+    """
+    try:
+        api_key = st.secrets["GEMINI_API_KEY"]
+    except Exception:
+        api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        raise KeyError("GEMINI_API_KEY")
+    return api_key
+
+def _resolve_api_key():
+    """Returns the API key, or None if it isn't configured."""
+    try:
+        return _load_api_key()
+    except KeyError:
+        return None
+
+def _show_error(message):
+    """Shows an error and keeps it in session state, so the app can show it again without refetching."""
+    st.error(message)
+    st.session_state.fetch_error = message
+
+def initialize_gemini(system_instruction=None, response_schema=None):
+    """Resolves the API key and returns the shared Gemini model (None if missing)."""
+    api_key = _resolve_api_key()
+    if not api_key:
+        _show_error("⚠️ GEMINI_API_KEY not found! Check your Streamlit Secrets.")
+        return None
+
+    return _get_model(api_key, system_instruction, response_schema)
+
+@st.cache_resource
+def get_disk_cache():
+    """Opens the on-disk response cache (survives process restarts)."""
+    import diskcache # Deferred with the other heavy imports; only needed once a graph is requested
+
+    return diskcache.Cache(CACHE_DIR)
+
+# Per-mode fingerprint of the instruction text (it's static, so hash it once)
+_SYSTEM_HASHES = {
+    mode: hashlib.sha1(instruction.encode()).hexdigest()[:8]
+    for mode, instruction in SYSTEM_INSTRUCTIONS.items()
+}
+
+def _normalize_query(query):
+    """Case/whitespace-insensitive form of a query, so "openai " and "OpenAI" share a cache entry."""
+    return " ".join(query.split()).casefold()
+
+def _cache_key(mode, query, filters):
+    """Content-addressed cache key over everything that affects the model output."""
+    payload = orjson.dumps(
+        [PROMPT_VERSION, MODEL_NAME, _SYSTEM_HASHES[mode], mode, _normalize_query(query), filters],
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _cached_raw(cache_key):
+    """In-memory tier over the disk cache. Raises KeyError on a miss so misses are never cached."""
+    cached_text = get_disk_cache().get(cache_key)
+    if cached_text is None:
+        raise KeyError(cache_key)
+    return cached_text
+
+def _parse_partial(text):
+    """Best-effort parse of a truncated JSON document.
+
+    Cuts the text back to the last closed object/array, or the last complete
+    top-level member, and closes whatever is still open, so only fully
+    received entries show up in the result (the center fields before Layer 1).
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    stack = []
+    last_safe = None
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            stack.append("}")
+        elif ch == "[":
+            stack.append("]")
+        elif ch in "}]" and stack:
+            stack.pop()
+            last_safe = (i + 1, "".join(reversed(stack)))
+        elif ch == "," and len(stack) == 1:
+            last_safe = (i, "}") # Every top-level member before this comma is complete
+    if last_safe is None:
+        return None
+    end, closers = last_safe
+    try:
+        return orjson.loads(text[start:end] + closers)
+    except orjson.JSONDecodeError:
+        return None
+
+# A comma directly before a closing bracket: the most common near-miss in model JSON
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+def _loads(text):
+    """Parses a model response; stray wrapping (a markdown fence, prose) is only cut if the raw text doesn't parse."""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        # Slice from the first opening to the last closing bracket of the outermost value
+        start = min((i for i in (text.find("{"), text.find("[")) if i != -1), default=-1)
+        if start == -1:
+            raise
+        end = text.rfind("}" if text[start] == "{" else "]")
+        sliced = text[start:end + 1]
+    try:
+        return orjson.loads(sliced)
+    except orjson.JSONDecodeError:
+        return orjson.loads(_TRAILING_COMMA_RE.sub(r"\1", sliced)) # Last resort before re-asking
+
+def _single_flight(cache_key, fn, *args):
+    """Runs fn once per cache key at a time; concurrent callers for the same key share its result."""
+    with _inflight_lock:
+        future = _inflight.get(cache_key)
+        is_leader = future is None
+        if is_leader:
+            future = concurrent.futures.Future()
+            _inflight[cache_key] = future
+    if not is_leader:
+        return future.result()
+
+    try:
+        result = fn(*args)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    except BaseException:
+        # Streamlit stops/reruns the script via BaseException; don't hand those to other sessions
+        future.set_exception(RuntimeError("The original request was interrupted. Please try again."))
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+
+def _claim_keys(cache_keys):
+    """Claims, for a background batch, every key nobody else is fetching. Returns the claimed keys in order.
+
+    The claims must be given back with _release_keys. Foreground fetches don't wait on them.
+    """
+    claimed = []
+    with _inflight_lock:
+        for key in cache_keys:
+            if key not in _inflight and key not in _batch_inflight:
+                _batch_inflight.add(key)
+                claimed.append(key)
+    return claimed
+
+def _release_keys(claimed):
+    """Gives back claims from _claim_keys."""
+    with _inflight_lock:
+        _batch_inflight.difference_update(claimed)
+
+def _progress_markdown(partial):
+    """Staged preview of a partial graph: the center node, then Layer 1, then the Layer 2 count.
+
+    Stages appear as their keys arrive, whatever order the model emits them in.
+    """
+    lines = []
+    if partial.get("n"):
+        lines.append(f"🎯 **{partial['n']}**" + (f" — _{partial['m']}_" if partial.get("m") else ""))
+    connections = partial.get("c") or []
+    if connections:
+        names = ", ".join(c.get("n", "?") for c in connections)
+        lines.append(f"🔗 **{len(connections)} connections so far:** {names}")
+        sub_count = sum(len(c.get("s") or ()) for c in connections)
+        if sub_count:
+            lines.append(f"🧩 {sub_count} secondary links")
+        latest = connections[-1]
+        lines.append(f"_{latest.get('n', '')}: {latest.get('r', '')}_")
+    return "  \n".join(lines)
+
+def _stream_completion(model, system_instruction, user_prompt, cache_key):
+    """Streams a completion from Gemini, showing connections as they arrive, and stores it on disk."""
+    # Another caller may have finished this exact request since our cache check
+    cached_text = get_disk_cache().get(cache_key)
+    if cached_text is not None:
+        return cached_text
+
+    progress = st.empty()
+    chunks = []
+    response = model.generate_content(user_prompt, stream=True)
+    for i, chunk in enumerate(response, start=1):
+        try:
+            chunks.append(chunk.text)
+        except ValueError:
+            continue # Chunk without text parts (e.g. the final finish-reason chunk)
+        # Re-parsing the whole buffer is O(n) per update, so only refresh every few chunks
+        if i % STREAM_PREVIEW_EVERY:
+            continue
+        partial = _parse_partial("".join(chunks))
+        if partial:
+            progress.markdown(_progress_markdown(partial))
+    progress.empty()
+    text = "".join(chunks)
+    output_chars = len(text)
+
+    # Parse first, then do the bookkeeping; `finally` still bills the call if the repair gives up
+    try:
+        _validate_response(_loads(text))
+    except ValueError as e: # orjson and fastjsonschema errors are both ValueErrors
+        text = _repair_response(model, system_instruction, user_prompt, e)
+    finally:
+        _record_usage(*_usage_tokens(response, len(system_instruction) + len(user_prompt), output_chars))
+
+    get_disk_cache().set(cache_key, text, expire=CACHE_EXPIRE_SECONDS)
+    return text
+
+def _repair_response(model, system_instruction, user_prompt, error):
+    """Re-asks the model with the validation error, up to REPAIR_ATTEMPTS times. Raises the last error if none is valid."""
+    for attempt in range(REPAIR_ATTEMPTS):
+        if attempt:
+            time.sleep(2 ** (attempt - 1)) # Back off before asking again: 1s, 2s, ...
+        repair_prompt = (
+            f"{user_prompt}\n\nYour previous response was malformed: {error}. "
+            "Return valid JSON per the schema."
+        )
+        response = model.generate_content(repair_prompt)
+        _record_usage(*_usage_tokens(response, len(system_instruction) + len(repair_prompt), len(response.text)))
+        try:
+            _validate_response(_loads(response.text))
+        except ValueError as e: # orjson and fastjsonschema errors are both ValueErrors
+            error = e
+        else:
+            return response.text
+    raise error
+
+def _usage_tokens(response, input_chars, output_chars):
+    """Returns (input_tokens, output_tokens, cached_tokens) for a call, as reported by the API when available."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.prompt_token_count:
+        # Thinking tokens are billed as output
+        output_tokens = usage.candidates_token_count + getattr(usage, "thoughts_token_count", 0)
+        return usage.prompt_token_count, output_tokens, usage.cached_content_token_count
+    # Fallback estimate (~4 characters per token)
+    return input_chars / 4, output_chars / 4, 0
+
+def _record_usage(input_tokens, output_tokens, cached_tokens=0):
+    """Adds the token count and cost of one model call to the session totals.
+
+    cached_tokens is the part of input_tokens served from Gemini's implicit prefix cache.
+    """
+    # Token and Cost Tracking (only reached on a cache miss)
+    st.session_state.token_usage += (input_tokens + output_tokens)
+
+    billed_input = input_tokens - cached_tokens * (1 - CACHED_INPUT_RATE)
+    st.session_state.session_cost += billed_input * INPUT_COST_PER_TOKEN + output_tokens * OUTPUT_COST_PER_TOKEN
+
+@st.cache_resource
+def _prefetch_executor():
+    """Shared worker pool for background prefetches."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="prefetch")
+
+def _fetch_batch_into_cache(model, disk_cache, mode, queries, filters, system_chars):
+    """Background worker: fetches graphs for several queries in one call and caches each one (no Streamlit calls).
+
+    Returns the (input_tokens, output_tokens, cached_tokens) of the call it made, or None if it did not call the model.
+    """
+    keyed = {_cache_key(mode, query, filters): query for query in queries}
+    claimed = _claim_keys([key for key in keyed if key not in disk_cache])
+    try:
+        if not claimed:
+            return None
+        claimed_queries = [keyed[key] for key in claimed]
+        user_prompt = _build_batch_prompt(mode, claimed_queries, filters)
+        response = model.generate_content(user_prompt)
+        usage = _usage_tokens(response, len(user_prompt) + system_chars, len(response.text))
+        try:
+            graphs = _loads(response.text)
+            _validate_batch(graphs) # Never cache a malformed graph
+        except ValueError:
+            return usage # Best effort: these queries are left for the foreground fetch
+        if len(graphs) != len(claimed):
+            return usage # Entries were dropped or added, so positions can't be trusted
+        for key, query, graph in zip(claimed, claimed_queries, graphs):
+            # Only cache a graph under the query it is about, in case the model reordered them
+            if _normalize_query(graph["n"]) != _normalize_query(query):
+                continue
+            disk_cache.set(key, orjson.dumps(graph).decode(), expire=CACHE_EXPIRE_SECONDS)
+        return usage
+    finally:
+        _release_keys(claimed)
+
+def _ping(model):
+    """Sends a one-token request so TLS, the channel and the model are warm for the first query."""
+    try:
+        model.generate_content("ok", generation_config={"max_output_tokens": 1})
+    except Exception:
+        pass # Warm-up is best effort
+
+@st.cache_resource(show_spinner=False)
+def _start_warm_up(api_key):
+    """Submits the warm-up ping once per process (and per key)."""
+    _prefetch_executor().submit(_ping, _get_model(api_key))
+    return True
+
+def warm_up_gemini():
+    """Starts the warm-up ping in the background so the page render isn't blocked.
+
+    Without a key nothing is cached, so a key added later still gets its warm-up.
+    """
+    api_key = _resolve_api_key()
+    if api_key:
+        _start_warm_up(api_key)
+
+def _build_prompt(mode, query, filters):
+    """Returns (system_instruction, user_prompt) for a request, or (None, None) for an unknown mode."""
+    system_instruction = SYSTEM_INSTRUCTIONS.get(mode)
+    if system_instruction is None:
+        return None, None
+
+    # Only the per-request constraints and input travel in the prompt itself
+    return system_instruction, f"{CONSTRAINTS_TEMPLATES[mode](**filters)}\nUser Input: '{query}'"
+
+def _build_batch_prompt(mode, queries, filters):
+    """Returns the user prompt asking for one graph per query, in order, as a JSON array."""
+    inputs = "\n".join(f"{i}. '{query}'" for i, query in enumerate(queries, start=1))
+    return (
+        f"{CONSTRAINTS_TEMPLATES[mode](**filters)}\n"
+        f"Return a JSON array with exactly {len(queries)} graphs, one per User Input, in this order.\n"
+        f"User Inputs:\n{inputs}"
+    )
+
+def _expand_response(data):
+    """Maps the compact structured-output keys back to the names the UI uses."""
+    return {
+        "center_node": {
+            "name": data["n"],
+            "type": data["t"],
+            "mission": data["m"],
+            "positive_news": data["p"],
+            "red_flags": data["r"],
+        },
+        "connections": [
+            {
+                "name": c["n"],
+                "reason": c["r"],
+                "sub_connections": [{"name": s["n"], "reason": s["r"]} for s in c.get("s", [])],
+            }
+            for c in data["c"]
+        ],
+    }
+
+def _parse_response(raw_text):
+    """Parses the model's JSON (structured output, so no markdown fences to strip)."""
+    return _expand_response(_loads(raw_text))
+
+def peek_cached_response(mode, query, filters):
+    """Returns the cached graph for a request without calling the model, or None on a miss."""
+    system_instruction, user_prompt = _build_prompt(mode, query, filters)
+    if system_instruction is None:
+        return None
+    try:
+        return _parse_response(_cached_raw(_cache_key(mode, query, filters)))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def get_gemini_response(mode, query, filters):
+    """Generates content based on the selected mode and filters."""
+    system_instruction, user_prompt = _build_prompt(mode, query, filters)
+    if system_instruction is None:
+        return None # Should not happen
+
+    try:
+        cache_key = _cache_key(mode, query, filters)
+        try:
+            raw_text = _cached_raw(cache_key)
+        except KeyError:
+            # The model (and the SDK import) is only needed on a cache miss
+            model = initialize_gemini(system_instruction, RESPONSE_SCHEMA)
+            if not model:
+                return None
+            with st.spinner(f"🔍 Analyzing {mode}..."):
+                raw_text = _single_flight(
+                    cache_key, _stream_completion, model, system_instruction, user_prompt, cache_key
+                )
+        
+        return _parse_response(raw_text)
+        
+    except Exception as e:
+        _show_error(f"AI Analysis Error: {e}")
+        return None
+
+def prefetch_responses(mode, queries, filters):
+    """Warms the disk cache for likely next queries with one background call. Returns its Future, or None."""
+    system_instruction = SYSTEM_INSTRUCTIONS.get(mode)
+    if system_instruction is None:
+        return None
+
+    disk_cache = get_disk_cache()
+    queries = [q for q in queries if _cache_key(mode, q, filters) not in disk_cache][:PREFETCH_LIMIT]
+    if not queries:
+        return None
+    # Resolved silently: a background warm-up has nothing to tell the user about a missing key
+    api_key = _resolve_api_key()
+    if not api_key:
+        return None
+    model = _get_model(api_key, system_instruction, BATCH_RESPONSE_SCHEMA)
+
+    # One round-trip for all neighbors instead of one per node. A click on a node
+    # still in flight fetches it in the foreground rather than waiting on the batch.
+    return _prefetch_executor().submit(
+        _fetch_batch_into_cache, model, disk_cache, mode, queries, filters, len(system_instruction)
+    )
+
+def harvest_prefetch_usage(prefetch):
+    """Adds the cost of finished prefetches to the session totals.
+
+    `prefetch` is the session's list of batch Futures; finished ones are removed so each call is counted once.
+    """
+    pending = []
+    for future in prefetch:
+        if not future.done():
+            pending.append(future)
+        elif not future.cancelled() and future.exception() is None:
+            usage = future.result()
+            if usage:
+                _record_usage(*usage)
+    prefetch[:] = pending
+
+@st.cache_data(ttl=86400, max_entries=64, show_spinner=False)  # Drafts stay useful for a day
+def _draft_email(_model, company, mission):
+    """Generates (and caches) a cold email. Raises on failure, so errors are never cached.
+
+    `_model` is excluded from the cache key (leading underscore); it is the same shared instance every call.
+    """
+    prompt = f"""
+        Write a short, punchy (under 150 words) cold outreach email to a recruiter at {company}.
+        Context on Company: {mission}
+        Tone: Professional, enthusiastic.
+        Output: Just the email body.
+        """
+    response = _model.generate_content(prompt)
+    # Only reached on a cache miss, so repeat drafts are free
+    _record_usage(*_usage_tokens(response, len(prompt), len(response.text)))
+    return response.text
+
+def generate_email_draft(company, mission):
+    """Helper to generate a cold email using AI (Kept for Company Discovery Action Tab)"""
+    try:
+        model = initialize_gemini()
+        if not model:
+            return "Could not initialize AI model."
+        return _draft_email(model, company, mission)
+    except Exception:
+        return "Could not generate draft. Try again."
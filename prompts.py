@@ -0,0 +1,82 @@
+"""Prompt templates and the structured-output schema for the Career Graph Explorer modes."""
+
+# Part of every response cache key. Bump it when the schema or the way responses
+# are interpreted changes; edits to the instruction text are picked up automatically.
+PROMPT_VERSION = "2"
+
+# Static per-mode instructions. These are attached to the model as its system
+# instruction so they form a stable prefix; only filters + query vary per call.
+COMPANY_DISCOVERY_INSTRUCTION = """
+Career market-discovery engine. Input: a company or job title. Return a 3-layer graph of related companies, honoring every STRICT CONSTRAINT.
+Layer 0: the input entity with mission, positive news, red flags.
+Layer 1: exactly 10 related entities (competitors, partners, next-step companies).
+Layer 2: for each Layer 1 entity, its 2 top related companies or technologies.
+"""
+
+ROLE_SEARCH_INSTRUCTION = """
+Career path advisor. Input: a seed job title. Return a 3-layer career-progression graph, honoring every STRICT CONSTRAINT.
+Layer 0: the seed job title with mission, positive news, red flags.
+Layer 1: exactly 5 distinct alternative or next-step roles that fit its core skills.
+Layer 2: for each Layer 1 role, 2-3 high-value certifications or key skills for transitioning into that role.
+"""
+
+SYSTEM_INSTRUCTIONS = {
+    "Company Discovery": COMPANY_DISCOVERY_INSTRUCTION,
+    "Role Search": ROLE_SEARCH_INSTRUCTION,
+}
+
+# Per-request constraint blocks, pre-bound so each call is a single format(**filters)
+CONSTRAINTS_TEMPLATES = {
+    "Company Discovery": (
+        "STRICT CONSTRAINTS:\n"
+        "- Target Industry: {industry}\n"
+        "- Company Size Preference: {size}\n"
+        "- Work Style: {style}\n"
+    ).format,
+    "Role Search": (
+        "STRICT CONSTRAINTS:\n"
+        "- Target Industry: {industry}\n"
+        "- Preferred Role Function: {function}\n"
+    ).format,
+}
+
+# Structured-output schema (Gemini response_schema). Short keys keep the
+# generated output small; gemini_backend expands them back to the long names.
+# The descriptions tell the model what each key means, so the instructions
+# above don't need a key legend.
+_LINK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "n": {"type": "string", "description": "Layer 2 name (company, technology, certification or skill)"},
+        "r": {"type": "string", "description": "Why it relates to its Layer 1 entity"},
+    },
+    "required": ["n", "r"],
+}
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "n": {"type": "string", "description": "Corrected name of the input company or job title"},
+        "t": {"type": "string", "description": "Input type: 'Company/Job' or 'Job Title'"},
+        "m": {"type": "string", "description": "Mission"},
+        "p": {"type": "string", "description": "Positive news"},
+        "r": {"type": "string", "description": "Red flags"},
+        "c": {
+            "type": "array",
+            "description": "Layer 1 connections",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "n": {"type": "string", "description": "Layer 1 name (company or role title)"},
+                    "r": {"type": "string", "description": "Why it relates to the input"},
+                    "s": {"type": "array", "description": "Layer 2 connections", "items": _LINK_SCHEMA},
+                },
+                "required": ["n", "r", "s"],
+            },
+        },
+    },
+    "required": ["n", "t", "m", "p", "r", "c"],
+}
+
+# Neighbor prefetch asks for several graphs in a single call, one per input
+BATCH_RESPONSE_SCHEMA = {"type": "array", "items": RESPONSE_SCHEMA}